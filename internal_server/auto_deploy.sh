@@ -434,7 +434,7 @@ install_python_dependencies() {
     python3 -m pip install --upgrade pip
     
     # 安装管理工具依赖
-    pip3 install flask pyjwt requests pyyaml werkzeug
+    pip3 install flask pyjwt requests pyyaml werkzeug brotli
     
     info "Python依赖安装完成"
 }
@@ -1197,15 +1197,18 @@ mkdir -p "\$BACKUP_DIR"
 # 备份数据库
 docker exec element-postgres pg_dump -U ${POSTGRES_USER} ${POSTGRES_DB} > "\$BACKUP_DIR/database.sql"
 
-# 备份Synapse数据
-tar -czf "\$BACKUP_DIR/synapse_data.tar.gz" -C /opt/element-ess/data synapse
-
-# 备份配置文件
-tar -czf "\$BACKUP_DIR/configs.tar.gz" -C /opt/element-ess config
-
 # 清理旧备份
-find /opt/element-ess/backups -name "*.tar.gz" -mtime +${BACKUP_RETENTION_DAYS} -delete
-find /opt/element-ess/backups -type d -mtime +${BACKUP_RETENTION_DAYS} -exec rm -rf {} +
+# 只清理顶层的时间戳目录，增量备份仓库 (backups/repo) 由 admin backup prune 管理
+find /opt/element-ess/backups -mindepth 1 -maxdepth 1 -type d -name "[0-9]*_[0-9]*" -mtime +${BACKUP_RETENTION_DAYS} -exec rm -rf {} +
+
+# 增量快照 (配置、数据目录及admin.db)，需要管理工具 (ENABLE_ADMIN_TOOL=true)
+if [[ -x /usr/local/bin/admin ]]; then
+    /usr/local/bin/admin backup create && /usr/local/bin/admin backup prune --keep-days ${BACKUP_RETENTION_DAYS}
+else
+    # 未部署管理工具时回退到完整打包
+    tar -czf "\$BACKUP_DIR/synapse_data.tar.gz" -C /opt/element-ess/data synapse
+    tar -czf "\$BACKUP_DIR/configs.tar.gz" -C /opt/element-ess config
+fi
 
 echo "备份完成: \$BACKUP_DIR"
 EOF
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+element_admin命令行启动时间基准测试
+以admin包装器相同的方式 (python3 -m element_admin) 反复执行子命令，统计相对于空解释器的
+启动开销并与预算对比；同时检查命令行路径没有导入Web框架等重量级依赖。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from fakes import write_fake_bin
+from login_flood import percentile
+
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+# 命令行路径不允许导入的模块 (只在Web服务或具体子命令需要时导入)
+FORBIDDEN_MODULES = ('flask', 'werkzeug', 'jinja2', 'jwt', 'requests', 'yaml', 'http.client', 'concurrent.futures')
+
+COMMANDS = {
+    'version': ['version'],
+    'services_status': ['services', 'status', '--json'],
+    'stats': ['stats', '--json'],
+}
+
+def time_command(command, env, runs):
+    """重复执行命令，返回每次的墙钟耗时 (秒)；首次执行用于预热，不计入结果"""
+    timings = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        result = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} 退出码 {result.returncode}: {result.stderr.decode()}")
+    return timings[1:]
+
+def imported_modules(command, env):
+    """通过-X importtime获取命令执行期间导入的模块及累计耗时 (微秒)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='element_admin命令行启动时间基准测试')
+    parser.add_argument('--runs', type=int, default=30, help='每个命令的执行次数')
+    parser.add_argument('--budget-ms', type=float, default=60, help='相对空解释器的启动开销预算 (中位数，毫秒)')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='admin-cli-')
+    env = dict(
+        os.environ,
+        PYTHONPATH=SCRIPTS_DIR,
+        PATH=f"{write_fake_bin(os.path.join(workdir, 'bin'))}:{os.environ.get('PATH', '')}",
+        ADMIN_DB_PATH=os.path.join(workdir, 'admin.db'),
+    )
+    module = [sys.executable, '-m', 'element_admin']
+    
+    baseline = time_command([sys.executable, '-c', 'pass'], env, args.runs)
+    full_import = time_command([sys.executable, '-c', 'import element_admin'], env, max(args.runs // 3, 3))
+    results = {}
+    for name, argv in COMMANDS.items():
+        timings = time_command(module + argv, env, args.runs)
+        results[name] = {
+            'median_ms': round(statistics.median(timings) * 1000, 1),
+            'p90_ms': round(percentile(timings, 90) * 1000, 1),
+            'overhead_ms': round((statistics.median(timings) - statistics.median(baseline)) * 1000, 1),
+        }
+    
+    modules = imported_modules(module + ['services', 'status', '--json'], env)
+    leaked = [name for name in FORBIDDEN_MODULES if name in modules]
+    slowest = sorted(((us, name) for name, us in modules.items() if '.' not in name and name != 'site'), reverse=True)[:5]
+    over_budget = [name for name, r in results.items() if r['overhead_ms'] > args.budget_ms]
+    
+    report = {
+        'python_startup_ms': round(statistics.median(baseline) * 1000, 1),
+        'full_import_ms': round(statistics.median(full_import) * 1000, 1),
+        'budget_ms': args.budget_ms,
+        'commands': results,
+        'forbidden_imports': leaked,
+        'slowest_imports_ms': {name: round(us / 1000, 1) for us, name in slowest},
+        'ok': not leaked and not over_budget,
+    }
+    
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"空解释器启动: {report['python_startup_ms']}ms  完整导入(含Web框架): {report['full_import_ms']}ms")
+        print(f"启动开销预算: {args.budget_ms:.0f}ms (中位数减去空解释器启动时间)\n")
+        for name, r in results.items():
+            mark = '超出预算' if name in over_budget else 'OK'
+            print(f"{name:<18} 中位数 {r['median_ms']:>7.1f}ms  p90 {r['p90_ms']:>7.1f}ms  开销 {r['overhead_ms']:>6.1f}ms  {mark}")
+        print(f"\n最慢的顶层导入: {', '.join(f'{name} {ms}ms' for name, ms in report['slowest_imports_ms'].items())}")
+        if leaked:
+            print(f"错误: 命令行路径导入了 {', '.join(leaked)}")
+    return 0 if report['ok'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
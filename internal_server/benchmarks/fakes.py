@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+本地模拟服务
+供基准测试和手动验证使用，无需真实的Element服务栈
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import jwt
+
+# 模拟系统命令输出 (代替读取/proc的top/free/df)
+FAKE_TOP = """top - 12:00:00 up 10 days,  3:12,  0 user,  load average: 0.52, 0.48, 0.41
+Tasks: 180 total,   1 running, 179 sleeping,   0 stopped,   0 zombie
+%Cpu(s): 12.5 us,  3.1 sy,  0.0 ni, 84.0 id,  0.4 wa,  0.0 hi,  0.0 si,  0.0 st
+MiB Mem :  15923.4 total,   2311.8 free,   9120.5 used,   4491.1 buff/cache
+MiB Swap:   2048.0 total,   2048.0 free,      0.0 used.   6402.9 avail Mem
+"""
+
+FAKE_FREE = """               total        used        free      shared  buff/cache   available
+Mem:            15Gi       8.9Gi       2.3Gi       120Mi       4.4Gi       6.3Gi
+Swap:          2.0Gi          0B       2.0Gi
+"""
+
+FAKE_DF = """Filesystem      Size  Used Avail Use% Mounted on
+/dev/sda1       492G  211G  256G  46% /
+"""
+
+DEFAULT_SERVICES = ('postgres', 'redis', 'synapse', 'element-web', 'element-call', 'livekit',
+                    'nginx', 'coturn', 'matrix-authentication-service', 'sliding-sync')
+
+def write_fake_bin(bin_dir, services=DEFAULT_SERVICES, restart_delay=0.5):
+    """在bin_dir生成模拟的docker-compose/top/free/df脚本，放在PATH最前面即可替换真实命令
+
+    脚本为普通shell脚本，保留了每次调用派生子进程的开销
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    ps_lines = '\n'.join(
+        json.dumps({'Service': name, 'Name': f'element-{name}', 'State': 'running', 'Health': 'healthy'})
+        for name in services
+    )
+    scripts = {
+        'top': f"cat <<'EOF'\n{FAKE_TOP}EOF\n",
+        'free': f"cat <<'EOF'\n{FAKE_FREE}EOF\n",
+        'df': f"cat <<'EOF'\n{FAKE_DF}EOF\n",
+        'docker-compose': (
+            'for arg in "$@"; do last="$arg"; done\n'
+            'case " $* " in\n'
+            f"  *' ps '*) cat <<'EOF'\n{ps_lines}\nEOF\n    ;;\n"
+            f'  *\' restart \'*) echo "Restarting $last ..."; sleep {restart_delay}; echo "Restarting $last ... done" ;;\n'
+            '  *) echo "unsupported: $*" >&2; exit 1 ;;\n'
+            'esac\n'
+        ),
+    }
+    for name, body in scripts.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\n' + body)
+        os.chmod(path, 0o755)
+    return bin_dir
+
+class _JSONServer:
+    """模拟HTTP服务的公共部分"""
+    
+    def __init__(self, host, port):
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+    
+    def _handler(self):
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _dispatch(self, method):
+                fake.requests += 1
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                status, payload = fake.handle(method, self.path, self.headers, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def do_GET(self):
+                self._dispatch('GET')
+            
+            def do_POST(self):
+                self._dispatch('POST')
+            
+            def do_PUT(self):
+                self._dispatch('PUT')
+        
+        return Handler
+    
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeSynapse(_JSONServer):
+    """模拟Synapse Admin API (用户列表/创建/停用、媒体统计、房间列表及数据库房间统计)
+
+    latency为每个请求附加的延迟秒数，用于模拟真实Synapse的响应时间
+    """
+    
+    def __init__(self, users=50, rooms=20, latency=0.0, host='127.0.0.1', port=0):
+        super().__init__(host, port)
+        self.latency = latency
+        self.users = [
+            {'name': f'@user{i}:example.com', 'user_id': f'@user{i}:example.com', 'displayname': f'User {i}',
+             'admin': i == 0, 'deactivated': False, 'media_count': i % 17, 'media_length': (i % 17) * 524288}
+            for i in range(users)
+        ]
+        self.rooms = [
+            {'room_id': f'!room{i}:example.com', 'name': f'Room {i}', 'joined_members': i % 30 + 1,
+             'state_events': (i % 30 + 1) * 12}
+            for i in range(rooms)
+        ]
+    
+    @property
+    def admin_api(self):
+        return f'{self.url}/_synapse/admin/v1'
+    
+    def _page(self, items, query, key, token_key, total_key):
+        start = int(query.get('from', ['0'])[0])
+        limit = int(query.get('limit', ['100'])[0])
+        body = {key: items[start:start + limit], total_key: len(items)}
+        if start + limit < len(items):
+            body[token_key] = start + limit
+        return body
+    
+    def handle(self, method, path, headers, body):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        version, route = url.path[len('/_synapse/admin/'):].partition('/')[::2]
+        route = '/' + route
+        if route == '/users' and version == 'v2':
+            users = self.users
+            if query.get('deactivated', ['false'])[0] != 'true':
+                users = [user for user in users if not user['deactivated']]
+            return 200, self._page(users, query, 'users', 'next_token', 'total')
+        if route.startswith('/users/') and method == 'PUT' and version == 'v2':
+            user_id = route[len('/users/'):]
+            self.users.append({'name': user_id, 'user_id': user_id, 'displayname': body.get('displayname'),
+                               'admin': bool(body.get('admin')), 'deactivated': False,
+                               'media_count': 0, 'media_length': 0})
+            return 201, {'name': user_id}
+        if route.startswith('/deactivate/') and method == 'POST':
+            user_id = route[len('/deactivate/'):]
+            for user in self.users:
+                if user['name'] == user_id:
+                    user['deactivated'] = True
+                    return 200, {'id_server_unbind_result': 'success'}
+            return 404, {'errcode': 'M_NOT_FOUND', 'error': 'User not found'}
+        if route == '/statistics/users/media':
+            return 200, self._page(self.users, query, 'users', 'next_token', 'total')
+        if route == '/statistics/database/rooms':
+            return 200, {'rooms': [{'room_id': r['room_id'], 'estimated_size': r['state_events'] * 2048}
+                                   for r in self.rooms]}
+        if route == '/rooms':
+            return 200, self._page(self.rooms, query, 'rooms', 'next_batch', 'total_rooms')
+        return 404, {'errcode': 'M_UNRECOGNIZED', 'error': 'Unrecognized request'}
+
+class FakeLiveKit(_JSONServer):
+    """模拟LiveKit Server API (Twirp RoomService的ListRooms/ListParticipants)
+
+    rooms为 {房间名: [每个参与者的轨道数, ...]}，请求需携带有效的服务端令牌
+    """
+    
+    def __init__(self, api_key, api_secret, rooms=None, host='127.0.0.1', port=0):
+        super().__init__(host, port)
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.rooms = rooms if rooms is not None else {}
+    
+    def handle(self, method, path, headers, body):
+        try:
+            claims = jwt.decode(headers.get('Authorization', '')[len('Bearer '):],
+                                self.api_secret, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return 401, {'code': 'unauthenticated', 'msg': 'invalid token'}
+        if claims.get('iss') != self.api_key:
+            return 401, {'code': 'unauthenticated', 'msg': 'unknown api key'}
+        grants = claims.get('video', {})
+        
+        if path == '/twirp/livekit.RoomService/ListRooms':
+            if not grants.get('roomList'):
+                return 403, {'code': 'permission_denied', 'msg': 'roomList required'}
+            return 200, {'rooms': [
+                {'sid': f'RM_{name}', 'name': name,
+                 'num_participants': len(tracks),
+                 'num_publishers': sum(1 for t in tracks if t)}
+                for name, tracks in self.rooms.items()
+            ]}
+        if path == '/twirp/livekit.RoomService/ListParticipants':
+            room = body.get('room')
+            if not grants.get('roomAdmin') or grants.get('room') != room:
+                return 403, {'code': 'permission_denied', 'msg': 'roomAdmin required'}
+            return 200, {'participants': [
+                {'sid': f'PA_{room}_{i}', 'identity': f'user{i}',
+                 'tracks': [{'sid': f'TR_{room}_{i}_{t}'} for t in range(count)]}
+                for i, count in enumerate(self.rooms.get(room, []))
+            ]}
+        return 404, {'code': 'bad_route', 'msg': path}
+
+def main():
+    """单独运行模拟服务"""
+    parser = argparse.ArgumentParser(description='本地模拟服务')
+    parser.add_argument('service', choices=['livekit', 'synapse', 'bin'])
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--bin-dir', default='fakebin', help='模拟命令输出目录 (bin)')
+    parser.add_argument('--users', type=int, default=50, help='模拟用户数 (synapse)')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的附加延迟秒数 (synapse)')
+    parser.add_argument('--api-key', default='devkey')
+    parser.add_argument('--api-secret', default='secret')
+    parser.add_argument('--rooms', type=int, default=3, help='模拟房间数')
+    parser.add_argument('--participants', type=int, default=4, help='每个房间的参与者数')
+    args = parser.parse_args()
+    
+    if args.service == 'bin':
+        print(f'模拟命令已生成: export PATH={os.path.abspath(write_fake_bin(args.bin_dir))}:$PATH')
+        return
+    if args.service == 'synapse':
+        fake = FakeSynapse(args.users, args.rooms, args.latency, port=args.port)
+        print(f'模拟Synapse Admin API运行于 {fake.admin_api}')
+    else:
+        rooms = {f'room{i}': [2] * args.participants for i in range(args.rooms)}
+        fake = FakeLiveKit(args.api_key, args.api_secret, rooms, port=args.port)
+        print(f'模拟LiveKit运行于 {fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+element_admin端点负载测试
+在子进程中启动element_admin (开发服务器或gunicorn生产模式)，docker-compose、Synapse、
+LiveKit以及top/free/df均由本地模拟服务代替。对每个端点施加并发负载，统计延迟百分位、
+吞吐量、服务端CPU (区分进程自身与派生子进程) 和内存 (PSS)，并可保存基线用于回归对比。
+各阶段 (subprocess/sqlite/http/docker_api/password_hash) 的耗时取自服务端/api/metrics中
+admin_stage_duration_seconds在压测前后的差值，包含同一时段内后台收集线程的调用。
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import argparse
+import platform
+import re
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fakes import FakeLiveKit, FakeSynapse, write_fake_bin
+from login_flood import percentile
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'admin123'
+LIVEKIT_KEY = 'bench-key'
+LIVEKIT_SECRET = 'bench-secret-bench-secret-bench-secret'
+METRICS_TOKEN = 'bench-metrics-token'
+# 被压测的端点不直接调用Synapse，模拟服务只供后台使用统计收集线程访问
+SYNAPSE_LATENCY = 0.005
+# 服务端每秒写出一次各进程的指标快照，读取前需等待
+METRICS_FLUSH_WAIT = 1.5
+STAGE_METRIC = re.compile(r'^admin_stage_duration_seconds_(sum|count)\{(.*)\} (\S+)$')
+STAGES = ('subprocess', 'sqlite', 'http', 'docker_api', 'password_hash')
+
+# 端点名称 -> (方法, 路径, 认证方式)
+ENDPOINTS = {
+    'dashboard': ('GET', '/dashboard', 'session'),
+    'api_stats': ('GET', '/api/stats', 'token'),
+    'api_services': ('GET', '/api/services', 'token'),
+    'login': ('POST', '/login', None),
+}
+
+# 对比基线时检查的指标: (键, 数值越大越好)
+COMPARE_METRICS = (
+    ('p50_ms', False),
+    ('p99_ms', False),
+    ('throughput', True),
+    ('cpu_ms_per_request', False),
+)
+
+def serve(args):
+    """子进程入口: 调整基准测试所需的模块配置后启动element_admin"""
+    sys.path.insert(0, SCRIPTS_DIR)
+    import element_admin
+    
+    element_admin.SYNAPSE_ADMIN_API = f"{os.environ['BENCH_SYNAPSE_API']}/v1"
+    element_admin.SYNAPSE_ADMIN_API_V2 = f"{os.environ['BENCH_SYNAPSE_API']}/v2"
+    # 测量的是登录本身的开销，关闭限流和锁定
+    element_admin.LOGIN_IP_BURST = element_admin.LOGIN_USER_BURST = 10 ** 9
+    element_admin.LOGIN_LOCKOUT_THRESHOLD = 10 ** 9
+    
+    if args.production:
+        element_admin.run_production_server('127.0.0.1', args.port, args.workers, args.threads, 60)
+    else:
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        element_admin.app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def process_tree(root_pid):
+    """返回root_pid及其所有后代进程的PID"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+def memory_bytes(pid, rss_pages):
+    """进程内存占用: 优先使用PSS (按比例分摊fork后共享的页面，进程树求和不会重复计算)"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss_pages * PAGE_SIZE
+
+def tree_usage(root_pid):
+    """进程树的CPU秒数 (自身, 已回收子进程) 与内存字节数"""
+    own = reaped = memory = 0
+    for pid in process_tree(root_pid):
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        own += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        reaped += (int(fields[13]) + int(fields[14])) / CLOCK_TICKS
+        memory += memory_bytes(pid, int(fields[21]))
+    return own, reaped, memory
+
+class MemorySampler:
+    """后台定时采样进程树内存占用，记录峰值"""
+    
+    def __init__(self, root_pid, interval=0.05):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, tree_usage(self.root_pid)[2])
+            self.stopped.wait(self.interval)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+def wait_ready(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'element_admin启动失败，退出码 {process.returncode}')
+        try:
+            if requests.get(f'{base_url}/login', timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('等待element_admin启动超时')
+
+def stage_totals(base_url):
+    """读取服务端各阶段累计耗时，返回 {阶段: [秒数, 调用次数]}"""
+    time.sleep(METRICS_FLUSH_WAIT)
+    response = requests.get(f'{base_url}/api/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'}, timeout=10)
+    response.raise_for_status()
+    totals = {}
+    for line in response.text.splitlines():
+        match = STAGE_METRIC.match(line)
+        if not match:
+            continue
+        kind, labels, value = match.groups()
+        stage = re.search(r'stage="([^"]*)"', labels).group(1)
+        totals.setdefault(stage, [0.0, 0])[0 if kind == 'sum' else 1] += float(value)
+    return totals
+
+def make_client(base_url, auth):
+    """创建带认证状态的会话 (每个并发线程一个，复用连接)"""
+    client = requests.Session()
+    if auth == 'session':
+        response = client.post(f'{base_url}/login', allow_redirects=False,
+                               data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'登录失败: HTTP {response.status_code}')
+    elif auth == 'token':
+        response = client.post(f'{base_url}/api/token',
+                               json={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+        response.raise_for_status()
+        client.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+    return client
+
+def run_endpoint(base_url, server_pid, name, total, concurrency, warmup):
+    """对单个端点施加负载并返回统计结果"""
+    method, path, auth = ENDPOINTS[name]
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    data = {'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD} if name == 'login' else None
+    
+    def attempt(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = make_client(base_url, auth)
+            with clients_lock:
+                clients.append(client)
+        start = time.perf_counter()
+        try:
+            response = client.request(method, f'{base_url}{path}', data=data, allow_redirects=False)
+            response.content
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 预热: 建立连接与会话，填充模板和令牌缓存
+        list(executor.map(attempt, range(max(warmup, concurrency))))
+        latencies.clear()
+        statuses.clear()
+        
+        stages_start = stage_totals(base_url)
+        own_start, reaped_start, memory_start = tree_usage(server_pid)
+        with MemorySampler(server_pid) as sampler:
+            start = time.perf_counter()
+            list(executor.map(attempt, range(total)))
+            wall = time.perf_counter() - start
+        own_end, reaped_end, memory_end = tree_usage(server_pid)
+        stages_end = stage_totals(base_url)
+    
+    for client in clients:
+        client.close()
+    
+    cpu_own = own_end - own_start
+    cpu_children = reaped_end - reaped_start
+    stages = {}
+    for stage, (seconds, calls) in stages_end.items():
+        seconds_start, calls_start = stages_start.get(stage, (0.0, 0))
+        if calls > calls_start:
+            stages[stage] = {
+                'ms_per_request': round((seconds - seconds_start) / total * 1000, 3),
+                'calls_per_request': round((calls - calls_start) / total, 2),
+            }
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'wall_s': round(wall, 3),
+        'throughput': round(total / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        'cpu_s': round(cpu_own + cpu_children, 3),
+        'cpu_children_s': round(cpu_children, 3),
+        'cpu_ms_per_request': round((cpu_own + cpu_children) / total * 1000, 3),
+        'memory_start_mb': round(memory_start / 1048576, 1),
+        'memory_peak_mb': round(max(sampler.peak, memory_end) / 1048576, 1),
+        'stages': stages,
+    }
+
+def print_report(results):
+    header = (f"{'端点':<14}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+              f"{'CPU/req':>10}{'子进程%':>9}{'内存峰值':>10}  状态码")
+    print(header)
+    print('-' * (len(header) + 16))
+    for name, r in results.items():
+        children_pct = r['cpu_children_s'] / r['cpu_s'] * 100 if r['cpu_s'] else 0
+        print(f"{name:<14}{r['throughput']:>9.1f}{r['p50_ms']:>8.1f}ms{r['p90_ms']:>7.1f}ms"
+              f"{r['p99_ms']:>7.1f}ms{r['max_ms']:>7.1f}ms{r['cpu_ms_per_request']:>8.2f}ms"
+              f"{children_pct:>8.0f}%{r['memory_peak_mb']:>8.1f}MB  {r['statuses']}")
+    
+    print(f"\n各阶段耗时 (每请求毫秒 / 每请求调用次数):")
+    print(f"{'端点':<14}" + ''.join(f'{stage:>20}' for stage in STAGES))
+    for name, r in results.items():
+        cells = []
+        for stage in STAGES:
+            value = r.get('stages', {}).get(stage)
+            cells.append(f"{value['ms_per_request']:>10.2f}ms / {value['calls_per_request']:<5}" if value else f"{'-':>20}")
+        print(f"{name:<14}" + ''.join(cells))
+
+def compare(results, baseline, threshold):
+    """与基线对比，返回回归项列表"""
+    regressions = []
+    print(f"\n与基线对比 ({baseline['created_at']}, 阈值 {threshold * 100:.0f}%):")
+    for name, r in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"  {name}: 基线中无此端点")
+            continue
+        parts = []
+        for key, higher_is_better in COMPARE_METRICS:
+            if not base.get(key):
+                continue
+            change = (r[key] - base[key]) / base[key]
+            regressed = -change > threshold if higher_is_better else change > threshold
+            parts.append(f"{key} {base[key]}→{r[key]} ({change * 100:+.0f}%{' !' if regressed else ''})")
+            if regressed:
+                regressions.append((name, key))
+        print(f"  {name}: " + ', '.join(parts))
+    return regressions
+
+def baseline_path(name):
+    return name if name.endswith('.json') else os.path.join(BASELINE_DIR, f'{name}.json')
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='element_admin端点负载测试')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"逗号分隔的端点 ({', '.join(ENDPOINTS)})")
+    parser.add_argument('--requests', type=int, default=500, help='每个端点的请求数')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发数')
+    parser.add_argument('--warmup', type=int, default=20, help='每个端点的预热请求数')
+    parser.add_argument('--production', action='store_true', help='以gunicorn生产模式启动')
+    parser.add_argument('--workers', type=int, default=2, help='生产模式worker进程数')
+    parser.add_argument('--threads', type=int, default=4, help='每个worker的线程数')
+    parser.add_argument('--real-system', action='store_true', help='使用真实的top/free/df (只模拟docker-compose)')
+    parser.add_argument('--save-baseline', metavar='NAME', help='将结果保存为基线 (baselines/NAME.json)')
+    parser.add_argument('--compare', metavar='NAME', help='与已保存的基线对比，出现回归时退出码为1')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定回归的相对变化阈值')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        return serve(args)
+    
+    names = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"未知端点: {', '.join(unknown)}")
+    
+    workdir = tempfile.mkdtemp(prefix='admin-load-')
+    bin_dir = os.path.join(workdir, 'bin')
+    write_fake_bin(bin_dir)
+    if args.real_system:
+        for name in ('top', 'free', 'df'):
+            os.remove(os.path.join(bin_dir, name))
+    synapse = FakeSynapse(latency=SYNAPSE_LATENCY).start()
+    livekit = FakeLiveKit(LIVEKIT_KEY, LIVEKIT_SECRET, {f'room{i}': [2, 1, 0] for i in range(5)}).start()
+    
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        PATH=f"{bin_dir}:{os.environ.get('PATH', '')}",
+        ADMIN_DB_PATH=os.path.join(workdir, 'data', 'admin.db'),
+        ADMIN_JWT_SECRET='bench-' + os.urandom(16).hex(),
+        ADMIN_BACKUP_REPO=os.path.join(workdir, 'backups'),
+        SYNAPSE_ADMIN_TOKEN='bench-token',
+        ADMIN_METRICS_TOKEN=METRICS_TOKEN,
+        BENCH_SYNAPSE_API=synapse.admin_api.rsplit('/', 1)[0],
+        LIVEKIT_API_URLS=livekit.url,
+        LIVEKIT_API_KEY=LIVEKIT_KEY,
+        LIVEKIT_API_SECRET=LIVEKIT_SECRET,
+    )
+    os.makedirs(os.path.dirname(env['ADMIN_DB_PATH']))
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)]
+    if args.production:
+        command += ['--production', '--workers', str(args.workers), '--threads', str(args.threads)]
+    
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    server = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    results = {}
+    try:
+        wait_ready(base_url, server)
+        for name in names:
+            if not args.json:
+                print(f"压测 {name} ...", file=sys.stderr)
+            results[name] = run_endpoint(base_url, server.pid, name, args.requests, args.concurrency, args.warmup)
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+        log.close()
+        synapse.stop()
+        livekit.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'config': {
+            'mode': f'gunicorn {args.workers}x{args.threads}' if args.production else 'werkzeug threaded',
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'real_system': args.real_system,
+        },
+        'results': results,
+    }
+    
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"模式: {report['config']['mode']}  每端点请求数: {args.requests}  并发: {args.concurrency}\n")
+        print_report(results)
+    
+    if args.save_baseline:
+        path = baseline_path(args.save_baseline)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {path}", file=sys.stderr)
+    
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline['config'] != report['config']:
+            print(f"警告: 基线配置不同 {baseline['config']}", file=sys.stderr)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
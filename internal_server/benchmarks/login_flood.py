@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+登录洪泛基准测试
+在本地启动element_admin，以并发错误密码请求冲击/login，统计吞吐量、延迟和CPU占用
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+def percentile(values, pct):
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def cpu_seconds():
+    """当前进程树的CPU时间 (密码哈希在forkserver进程池中执行，工作进程是孙进程，
+    RUSAGE_CHILDREN统计不到，需从/proc汇总整棵进程树)"""
+    # load_test导入了本模块的percentile，在函数内导入避免循环导入
+    from load_test import tree_usage
+    own, reaped, _ = tree_usage(os.getpid())
+    return own + reaped
+
+def run_flood(base_url, username, total, concurrency):
+    """并发发送错误密码登录请求"""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    
+    def attempt(i):
+        start = time.perf_counter()
+        response = requests.post(
+            f'{base_url}/login',
+            data={'username': username, 'password': 'wrong-password'},
+            allow_redirects=False
+        )
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(attempt, range(total)))
+    return time.perf_counter() - start, latencies, statuses
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='element_admin登录洪泛基准测试')
+    parser.add_argument('--requests', type=int, default=500, help='请求总数')
+    parser.add_argument('--concurrency', type=int, default=32, help='并发数')
+    parser.add_argument('--username', default='admin', help='登录用户名 (使用已存在的账户以触发密码哈希校验)')
+    parser.add_argument('--no-throttle', action='store_true', help='关闭登录限流作为对照组')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='admin-bench-')
+    os.environ['ADMIN_DB_PATH'] = os.path.join(workdir, 'admin.db')
+    
+    import element_admin
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    
+    if args.no_throttle:
+        element_admin.LOGIN_IP_BURST = element_admin.LOGIN_USER_BURST = 10 ** 9
+        element_admin.LOGIN_LOCKOUT_THRESHOLD = 10 ** 9
+    
+    manager = element_admin.get_admin_manager()
+    server = make_server('127.0.0.1', 0, element_admin.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    
+    cpu_start = cpu_seconds()
+    wall, latencies, statuses = run_flood(base_url, args.username, args.requests, args.concurrency)
+    server.shutdown()
+    # 在关闭进程池前统计，工作进程退出后由forkserver回收，其CPU时间不再可见
+    cpu_used = cpu_seconds() - cpu_start
+    if manager._hash_pool is not None:
+        manager._hash_pool.shutdown()
+    
+    print(f"模式: {'无限流' if args.no_throttle else '限流'}")
+    print(f"请求数: {args.requests}  并发: {args.concurrency}  耗时: {wall:.2f}s")
+    print(f"吞吐量: {args.requests / wall:.1f} req/s")
+    print(f"延迟: p50={percentile(latencies, 50) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms")
+    print(f"状态码: {dict(sorted(statuses.items()))}")
+    print(f"CPU时间: {cpu_used:.2f}s  平均占用: {cpu_used / wall * 100:.0f}% (单核=100%)")
+
+if __name__ == '__main__':
+    main()